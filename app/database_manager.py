@@ -1,12 +1,17 @@
 # database_manager.py
 """
 Database manager using psycopg2.
-Provides safe connection handling and atomic insert for Model.
+Provides pooled connection handling and atomic insert for Model.
 Configure DB connection via environment variables or edit DB_CONFIG below.
 """
 
 import os
+import threading
+import functools
 import psycopg2
+import redis
+from psycopg2 import pool
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
 
 DB_CONFIG = {
@@ -18,20 +23,147 @@ DB_CONFIG = {
 }
 
 
+# Redis cache in front of the model listing (shared by web app and importer)
+REDIS_URL = os.getenv("MODELDB_REDIS_URL", "redis://localhost:6379/0")
+# Cached listing pages live under MODELS_CACHE_KEY:<version>:<limit>:<offset>; bumping the version invalidates
+# all of them at once, and a reader that fetched old rows can only write them under a dead version
+MODELS_CACHE_KEY = "v1:models:list"
+MODELS_CACHE_VERSION_KEY = "v1:models:list:version"
+MODELS_CACHE_TTL = 60  # seconds
+# A stalled Redis must not block requests or the importer; timeouts raise RedisError
+REDIS_TIMEOUT = 1  # seconds
+
+_REDIS = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+
+
+POOL_MIN_CONN = int(os.getenv("MODELDB_POOL_MIN", 5))
+POOL_MAX_CONN = int(os.getenv("MODELDB_POOL_MAX", 30))
+
+# Process-wide connection pool, created lazily on first use
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """Return the shared connection pool, creating it on first use."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = pool.ThreadedConnectionPool(
+                    minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN, **DB_CONFIG
+                )
+    return _POOL
+
+
+def close_pool():
+    """Close all pooled connections (call on application shutdown)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.closeall()
+            _POOL = None
+
+
+def is_disconnect(exc):
+    """
+    True if exc means the connection itself is gone (network blip, server restart, idle timeout).
+    OperationalError also covers query-level failures (QueryCanceled, deadlock, serialization,
+    too many connections); those carry a SQLSTATE outside class 08 / 57P0x and are not retried.
+    """
+    if not isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return False
+    code = getattr(exc, "pgcode", None)
+    return code is None or code.startswith("08") or code in ("57P01", "57P02", "57P03")
+
+
+def _checkout():
+    """
+    Take a connection from the pool and make sure it is still alive (pre-ping).
+    Stale connections are discarded; after a server restart every idle one may be stale,
+    so keep going until a live one is found or the pool hands out a fresh connection.
+    """
+    p = get_pool()
+    for _ in range(POOL_MAX_CONN):
+        conn = p.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # whatever the reason, a connection that can't run SELECT 1 is not reused
+            p.putconn(conn, close=True)
+    return p.getconn()
+
+
 @contextmanager
 def get_connection():
-    conn = psycopg2.connect(**DB_CONFIG)
+    p = get_pool()
+    conn = _checkout()
     try:
         yield conn
     finally:
+        # never hand a connection with an open transaction back to the pool;
+        # a connection that can't even roll back is closed instead
+        close = bool(conn.closed)
+        if not close:
+            try:
+                conn.rollback()
+            except Exception:
+                close = True
         try:
-            conn.close()
+            p.putconn(conn, close=close)
         except Exception:
             pass
 
 
+def retry_on_disconnect(max_retries=1):
+    """
+    Decorator: re-run a DB operation if its connection dropped mid-way.
+    The broken connection is discarded by get_connection, so the retry gets a live one.
+    Only use on operations that are safe to repeat (reads, idempotent DDL). Never on inserts:
+    if the connection drops after the server committed, a retry would insert twice or fail.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    if attempt == max_retries or not is_disconnect(e):
+                        raise
+                    print(f"Lost DB connection in {func.__name__} ({e}), retrying")
+        return wrapper
+    return decorator
+
+
+def invalidate_models_cache():
+    """Bump cached listing version so the web app sees new rows (best effort)."""
+    try:
+        _REDIS.incr(MODELS_CACHE_VERSION_KEY)
+    except redis.RedisError as e:
+        print(f"Could not invalidate models cache: {e}")
+
+
+# Relations created by init_database; if all exist the DDL is skipped
+SCHEMA_OBJECTS = (
+    "model", "tag", "rating", "modeltag",
+    "idx_model_order", "idx_model_polygon_count", "idx_model_format", "idx_rating_model_id",
+)
+
+# Set once the schema is known to be present in this process
+_SCHEMA_READY = False
+
+
+@retry_on_disconnect()
 def init_database():
-    """Create tables if they don't exist (safe)."""
+    """Create tables if they don't exist (safe). Cheap no-op once the schema is present."""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+
     schema_sql = """
     CREATE TABLE IF NOT EXISTS Model (
         model_id SERIAL PRIMARY KEY,
@@ -66,7 +198,11 @@ def init_database():
         PRIMARY KEY (model_id, tag_id)
     );
 
-    CREATE INDEX IF NOT EXISTS idx_model_download_date ON Model(download_date);
+    -- ordering index for the listing query (newest first): ORDER BY ... LIMIT walks it and
+    -- stops early; no INCLUDE columns, so rating updates stay HOT and the index stays small
+    DROP INDEX IF EXISTS idx_model_download_date;
+    DROP INDEX IF EXISTS idx_model_list;
+    CREATE INDEX IF NOT EXISTS idx_model_order ON Model (download_date DESC, model_id DESC);
     CREATE INDEX IF NOT EXISTS idx_model_polygon_count ON Model(polygon_count);
     CREATE INDEX IF NOT EXISTS idx_model_format ON Model(format);
     CREATE INDEX IF NOT EXISTS idx_rating_model_id ON Rating(model_id);
@@ -74,7 +210,16 @@ def init_database():
     with get_connection() as conn:
         with conn:
             with conn.cursor() as cur:
+                # probe catalog first; DDL takes locks even when nothing changes
+                cur.execute(
+                    "SELECT count(to_regclass(n)) FROM unnest(%s::text[]) AS n",
+                    (list(SCHEMA_OBJECTS),),
+                )
+                if cur.fetchone()[0] == len(SCHEMA_OBJECTS):
+                    _SCHEMA_READY = True
+                    return
                 cur.execute(schema_sql)
+    _SCHEMA_READY = True
     print("Database initialized / schema ensured.")
 
 
@@ -125,17 +270,81 @@ def insert_model(model_data: dict) -> int:
                     model_data.get("preview_file")
                 ))
                 model_id = cur.fetchone()[0]
-                return model_id
 
+    invalidate_models_cache()
+    return model_id
+
+
+# Column order used for bulk inserts into Model
+MODEL_COLUMNS = (
+    "model_name", "format", "source_url", "download_date", "created_by", "created_in",
+    "uploaded_by", "model_description", "polygon_count", "preview_file",
+)
+
+
+def insert_models_bulk(rows: list) -> list:
+    """
+    Insert many models in a single transaction using one multi-row INSERT.
+    rows: list of model_data dicts (same keys as insert_model).
+    Returns list of new model_ids in the same order as rows.
+    Raises exception on failure; nothing is committed in that case.
+    """
+    if not rows:
+        return []
+    for model_data in rows:
+        for r in ("model_name", "preview_file"):
+            if not model_data.get(r):
+                raise ValueError(f"Missing required field: {r}")
+
+    sql_insert = f"""
+        INSERT INTO Model ({", ".join(MODEL_COLUMNS)})
+        VALUES %s
+        RETURNING model_id;
+    """
+    values = [tuple(model_data.get(c) for c in MODEL_COLUMNS) for model_data in rows]
+
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                result = execute_values(cur, sql_insert, values, page_size=100, fetch=True)
+
+    invalidate_models_cache()
+    return [row[0] for row in result]
+
+@retry_on_disconnect()
+def find_model_id(model_name: str, preview_file: str):
+    """
+    Return model_id of an existing row with this name and preview file, else None.
+    Used to check whether an insert whose result was lost (dropped connection) actually committed.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT model_id FROM Model WHERE model_name = %s AND preview_file = %s",
+                (model_name, preview_file),
+            )
+            row = cur.fetchone()
+            return row[0] if row else None
+
+
+@retry_on_disconnect()
+def analyze_models():
+    """Refresh planner statistics for Model (run after bulk imports)."""
+    with get_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE Model;")
+
+
+@retry_on_disconnect()
 def get_all_models():
     """Fetch all models with their metadata."""
     with get_connection() as conn:
-        with conn.cursor() as cur:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
                 SELECT model_id, model_name, format, model_description, 
                        polygon_count, preview_file, average_rating, download_date
                 FROM Model
-                ORDER BY download_date DESC
+                ORDER BY download_date DESC, model_id DESC
             """)
-            columns = [desc[0] for desc in cur.description]
-            return [dict(zip(columns, row)) for row in cur.fetchall()]
\ No newline at end of file
+            return cur.fetchall()
\ No newline at end of file
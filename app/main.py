@@ -1,10 +1,18 @@
-from fastapi import FastAPI, Cookie, Response
+from fastapi import FastAPI, Cookie, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from jinja2 import Environment
+from cachetools import TTLCache
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+import asyncpg
+import functools
+import orjson
 import database_manager as db
 import uuid
 
-app = FastAPI()
+# orjson serializes rows (incl. dates) much faster than the stdlib encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Allow cross-origin requests (needed for local development)
 app.add_middleware(
@@ -15,11 +23,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize database when app starts
+# Initialize database and async connection pool when app starts
 @app.on_event("startup")
-def startup():
+async def startup():
     db.init_database()
+    # psycopg2 pool is only needed for schema setup; reads go through asyncpg
+    db.close_pool()
     print("Database initialized!")
+    app.state.pg = await asyncpg.create_pool(
+        host=db.DB_CONFIG["host"],
+        port=db.DB_CONFIG["port"],
+        user=db.DB_CONFIG["user"],
+        password=db.DB_CONFIG["password"],
+        database=db.DB_CONFIG["dbname"],
+        min_size=5,
+        max_size=20,
+        command_timeout=60,
+    )
+    app.state.redis = aioredis.from_url(
+        db.REDIS_URL, socket_connect_timeout=db.REDIS_TIMEOUT, socket_timeout=db.REDIS_TIMEOUT
+    )
+
+# Release async pools when app stops
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.pg.close()
+    await app.state.redis.aclose()
+
+# Errors meaning the pooled connection itself is gone (not query-level failures)
+DISCONNECT_ERRORS = (asyncpg.exceptions.ConnectionDoesNotExistError, asyncpg.PostgresConnectionError, ConnectionError)
+
+def retry_on_disconnect(max_retries=1):
+    """Re-run an async DB read if its connection dropped; the pool replaces closed connections."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            for attempt in range(max_retries + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except DISCONNECT_ERRORS:
+                    if attempt == max_retries:
+                        raise
+        return wrapper
+    return decorator
 
 # Home page - just a simple welcome
 @app.get("/")
@@ -29,129 +75,177 @@ def home(user_id: str = Cookie(None), response: Response = None):
         response.set_cookie(key="user_id", value=user_id, max_age=31536000)
     return {"message": "3D Model Viewer API", "your_session_id": user_id}
 
+# Page size limits for model listing
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_OFFSET = 1_000_000
+
+# In-process cache in front of Redis for repeated hits within one worker
+_models_local = TTLCache(maxsize=64, ttl=5)
+
+# Listing query; conn.fetch() keeps it in asyncpg's per-connection statement cache,
+# so after the first call on a connection it is executed without a new Parse.
+# Ordered to match idx_model_order so Postgres can walk the index and stop at LIMIT.
+LIST_MODELS_SQL = """
+    SELECT model_id, model_name, format, model_description, 
+           polygon_count, preview_file, average_rating, download_date
+    FROM Model
+    ORDER BY download_date DESC, model_id DESC
+    LIMIT $1 OFFSET $2
+"""
+
+@retry_on_disconnect()
+async def query_models(limit: int, offset: int):
+    """Runs the listing query and converts records to dictionaries"""
+    async with app.state.pg.acquire() as conn:
+        rows = await conn.fetch(LIST_MODELS_SQL, limit, offset)
+    return [dict(r) for r in rows]
+
+async def fetch_models(limit: int, offset: int):
+    """Returns one page of models as list of dicts (local cache -> Redis -> database)"""
+    # every page has its own Redis key with a fixed TTL; importer bumps the version
+    page = f"{limit}:{offset}"
+    models = _models_local.get(page)
+    if models is not None:
+        return models
+
+    # Redis errors only disable caching, the database is still queried
+    # (version is read before the DB query, so rows fetched before an import
+    # can only ever be written under the old, no longer read, version)
+    cache_key = None
+    cached = None
+    try:
+        version = await app.state.redis.get(db.MODELS_CACHE_VERSION_KEY) or b"0"
+        cache_key = f"{db.MODELS_CACHE_KEY}:{version.decode()}:{page}"
+        cached = await app.state.redis.get(cache_key)
+    except RedisError:
+        pass
+
+    if cached is not None:
+        models = orjson.loads(cached)
+    else:
+        models = await query_models(limit, offset)
+        if cache_key is not None:
+            try:
+                await app.state.redis.set(cache_key, orjson.dumps(models), ex=db.MODELS_CACHE_TTL)
+            except RedisError:
+                pass
+
+    _models_local[page] = models
+    return models
+
 # Get all models as JSON (for API use)
 @app.get("/api/models")
-def get_models():
-    """Returns all models as JSON data"""
-    with db.get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT model_id, model_name, format, model_description, 
-                       polygon_count, preview_file, average_rating, download_date
-                FROM Model
-                ORDER BY download_date DESC
-            """)
-            
-            # Convert rows to dictionaries
-            columns = [desc[0] for desc in cur.description]
-            models = []
-            for row in cur.fetchall():
-                models.append(dict(zip(columns, row)))
-            
-            return {"models": models, "count": len(models)}
+async def get_models(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     offset: int = Query(0, ge=0, le=MAX_OFFSET)):
+    """Returns a page of models as JSON data"""
+    models = await fetch_models(limit, offset)
+    # Return response directly to skip FastAPI's jsonable_encoder pass
+    return ORJSONResponse({"models": models, "count": len(models), "limit": limit, "offset": offset})
+
+# Models page template, compiled once at import (autoescape guards against HTML in model fields)
+MODELS_PAGE = Environment(autoescape=True).from_string("""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>3D Models</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+            background-color: #f5f5f5;
+        }
+        h1 {
+            color: #333;
+        }
+        .model-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+            gap: 20px;
+            margin-top: 20px;
+        }
+        .model-card {
+            background: white;
+            border-radius: 8px;
+            padding: 20px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        .model-card h3 {
+            margin-top: 0;
+            color: #2c3e50;
+        }
+        .model-info {
+            color: #666;
+            font-size: 14px;
+            margin: 5px 0;
+        }
+        .rating {
+            color: #f39c12;
+            font-weight: bold;
+        }
+        .pager {
+            margin-top: 20px;
+            display: flex;
+            gap: 20px;
+        }
+        .no-models {
+            text-align: center;
+            padding: 40px;
+            color: #999;
+        }
+    </style>
+</head>
+<body>
+    <h1>3D Model Library</h1>
+    {% if models %}
+    <p>Showing models {{ offset + 1 }}–{{ offset + models|length }}</p>
+    <div class="model-grid">
+    {% for m in models %}
+        <div class="model-card">
+            <h3>{{ m.model_name }}</h3>
+            <div class="model-info">Format: {{ m.format or 'Unknown' }}</div>
+            <div class="model-info">Polygons: {{ m.polygon_count or 'N/A' }}</div>
+            <div class="model-info">Rating: <span class="rating">{{ '⭐' * (m.average_rating or 0)|int }}</span> ({{ m.average_rating or 0 }}/5)</div>
+            <div class="model-info">Uploaded: {{ m.download_date or 'Unknown' }}</div>
+            {% if m.model_description %}<p>{{ m.model_description }}</p>{% endif %}
+        </div>
+    {% endfor %}
+    </div>
+    {% elif offset > 0 %}
+    <div class="no-models">No more models on this page.</div>
+    {% else %}
+    <div class="no-models">No models uploaded yet.</div>
+    {% endif %}
+    <div class="pager">
+        {% if offset > 0 %}<a href="?limit={{ limit }}&offset={{ [offset - limit, 0]|max }}">&larr; Previous</a>{% endif %}
+        {% if has_next %}<a href="?limit={{ limit }}&offset={{ offset + limit }}">Next &rarr;</a>{% endif %}
+    </div>
+</body>
+</html>
+""")
 
 # Show models in a simple HTML page
 @app.get("/models", response_class=HTMLResponse)
-def show_models_page():
-    """Returns an HTML page displaying all models"""
-    with db.get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT model_id, model_name, format, model_description, 
-                       polygon_count, preview_file, average_rating, download_date
-                FROM Model
-                ORDER BY download_date DESC
-            """)
-            
-            models = cur.fetchall()
-    
-    # Build simple HTML
-    html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>3D Models</title>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 20px;
-                background-color: #f5f5f5;
-            }
-            h1 {
-                color: #333;
-            }
-            .model-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-                gap: 20px;
-                margin-top: 20px;
-            }
-            .model-card {
-                background: white;
-                border-radius: 8px;
-                padding: 20px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            .model-card h3 {
-                margin-top: 0;
-                color: #2c3e50;
-            }
-            .model-info {
-                color: #666;
-                font-size: 14px;
-                margin: 5px 0;
-            }
-            .rating {
-                color: #f39c12;
-                font-weight: bold;
-            }
-            .no-models {
-                text-align: center;
-                padding: 40px;
-                color: #999;
-            }
-        </style>
-    </head>
-    <body>
-        <h1>3D Model Library</h1>
-        <p>Total models: """ + str(len(models)) + """</p>
-    """
-    
-    if models:
-        html += '<div class="model-grid">'
-        for model in models:
-            model_id, name, fmt, desc, poly_count, preview, rating, date = model
-            html += f"""
-            <div class="model-card">
-                <h3>{name}</h3>
-                <div class="model-info">Format: {fmt or 'Unknown'}</div>
-                <div class="model-info">Polygons: {poly_count or 'N/A'}</div>
-                <div class="model-info">Rating: <span class="rating">{'⭐' * int(rating or 0)}</span> ({rating or 0}/5)</div>
-                <div class="model-info">Uploaded: {date or 'Unknown'}</div>
-                {f'<p>{desc}</p>' if desc else ''}
-            </div>
-            """
-        html += '</div>'
-    else:
-        html += '<div class="no-models">No models uploaded yet.</div>'
-    
-    html += """
-    </body>
-    </html>
-    """
-    
-    return html
+async def show_models_page(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           offset: int = Query(0, ge=0, le=MAX_OFFSET)):
+    """Returns an HTML page displaying a page of models"""
+    # fetch one extra row to know whether a next page exists
+    models = await fetch_models(limit + 1, offset)
+    has_next = len(models) > limit
+    return MODELS_PAGE.render(models=models[:limit], limit=limit, offset=offset, has_next=has_next)
+
+@retry_on_disconnect()
+async def db_version():
+    async with app.state.pg.acquire() as conn:
+        return await conn.fetchval("SELECT version();")
 
 # Test database connection
 @app.get("/test-db")
-def test_db():
+async def test_db():
     try:
-        with db.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT version();")
-                version = cur.fetchone()
-                return {"status": "success", "db_version": version[0]}
+        version = await db_version()
+        return {"status": "success", "db_version": version}
     except Exception as e:
         return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -2,25 +2,30 @@
 """
 Importer:
 - scans INPUT_DIR for .zip files (or subdirectories),
-- unpacks each zip into a temp folder,
+- processes zips in parallel worker processes (IMPORT_WORKERS),
+- reads metadata .txt straight from each zip,
 - finds required files (txt metadata, geometry, preview image),
 - normalizes model name, creates final_models/<model_name>/,
-- moves files into final folder (with safe filenames),
-- inserts DB record via db_manager.insert_model inside a safe transaction,
+- streams zip entries into final folder (with safe filenames),
+- inserts DB records in batches via db_manager.insert_models_bulk inside a safe transaction
+  (on a background thread, while the next zips are being processed),
 - on failure: rollback DB and delete partial folder, log error and continue.
 """
 
 import os
 import sys
+import errno
 import shutil
 import zipfile
-import tempfile
 import re
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
-from database_manager import init_database, insert_model
+from database_manager import init_database, insert_model, insert_models_bulk, analyze_models, find_model_id, is_disconnect
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -32,18 +37,22 @@ PREVIEW_EXTS = {".jpg", ".jpeg"}
 # Allowed geometry extensions
 GEOM_EXTS = {".obj", ".fbx", ".gltf", ".3ds"}
 
+# Number of imported models inserted into DB per transaction
+INSERT_BATCH_SIZE = 100
 
-def try_open(path):
-    """
-    Try opening file; return text content.
-    """
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read()
-        return content
-    except Exception:
-        pass
-    raise UnicodeDecodeError("Failed to open file", path)
+# Number of worker processes unpacking zips in parallel
+IMPORT_WORKERS = os.cpu_count() or 1
+
+# Workers write each model into ".<name>.partial" and rename it when complete,
+# so a worker killed mid-zip only leaves a staging folder that the next run removes
+PARTIAL_SUFFIX = ".partial"
+
+# Buffer size for streaming zip members to disk (fewer read/write syscalls than the 64 KiB default)
+COPY_BUFFER_SIZE = 1 << 20
+
+# Patterns used by slugify (compiled once)
+_EXT_RE = re.compile(r"\.[a-zA-Z0-9]{1,5}$")
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_\-]")
 
 
 def parse_metadata_from_text(text):
@@ -96,10 +105,10 @@ def slugify(name):
         return None
     s = name.strip()
     # remove file extension if present
-    s = re.sub(r"\.[a-zA-Z0-9]{1,5}$", "", s)
+    s = _EXT_RE.sub("", s)
     s = s.replace(" ", "_")
     # keep letters numbers underscore and dash
-    s = re.sub(r"[^A-Za-z0-9_\-]", "", s)
+    s = _UNSAFE_RE.sub("", s)
     if not s:
         s = "model"
     return s[:150]
@@ -107,75 +116,111 @@ def slugify(name):
 
 def find_preview_file(files):
     """Return filename of a preview if exists (jpg/png). Prefer jpg/jpeg first, else png."""
-    # files are Path objects or strings
-    # return the first matching extension in prioritized order
-    lower = [(f, Path(f).suffix.lower()) for f in files]
-    # prioritize jpg/jpeg
-    for f, ext in lower:
-        if ext in (".jpg", ".jpeg"):
-            return f
-    for f, ext in lower:
-        if ext == ".png":
+    # files are path objects; the matching object itself is returned
+    # single pass: remember first png, stop at first jpg/jpeg
+    first_png = None
+    for f in files:
+        ext = f.suffix.lower()
+        if ext in PREVIEW_EXTS:
             return f
-    return None
+        if ext == ".png" and first_png is None:
+            first_png = f
+    return first_png
 
 
 def find_geometry_file(files):
     for f in files:
-        ext = Path(f).suffix.lower()
-        if ext in GEOM_EXTS:
+        if f.suffix.lower() in GEOM_EXTS:
             return f
     return None
 
 
 def ensure_unique_dir(base_out_dir, desired_name):
     """
-    If base_out_dir/desired_name exists, append suffix _1, _2 etc.
+    Create base_out_dir/desired_name; if it exists, append suffix _1, _2 etc.
+    The directory is created atomically, so parallel workers never get the same one.
     """
     candidate = Path(base_out_dir) / desired_name
     i = 1
-    while candidate.exists():
-        candidate = Path(base_out_dir) / f"{desired_name}_{i}"
-        i += 1
-    return candidate
+    while True:
+        try:
+            candidate.mkdir(parents=True, exist_ok=False)
+            return candidate
+        except FileExistsError:
+            candidate = Path(base_out_dir) / f"{desired_name}_{i}"
+            i += 1
 
 
-def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
+def publish_dir(staging_dir, base_out_dir, desired_name):
+    """
+    Rename finished staging_dir to base_out_dir/desired_name (or _1, _2 ... if taken).
+    A rename onto an existing non-empty directory fails, so parallel workers can't clash.
+    """
+    candidate = Path(base_out_dir) / desired_name
+    i = 1
+    while True:
+        try:
+            os.rename(staging_dir, candidate)
+            return candidate
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            candidate = Path(base_out_dir) / f"{desired_name}_{i}"
+            i += 1
+
+
+def remove_partial_dirs(base_out_dir):
+    """Delete staging folders left behind by workers that died mid-import."""
+    with os.scandir(base_out_dir) as it:
+        for entry in it:
+            if entry.name.startswith(".") and PARTIAL_SUFFIX in entry.name and entry.is_dir(follow_symlinks=False):
+                logging.warning(f"Removing leftover partial folder {entry.path}")
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def is_junk_entry(name):
+    """True for OS metadata entries (macOS resource forks, .DS_Store, Thumbs.db) that are never imported."""
+    parts = name.split("/")
+    base = parts[-1]
+    return "__MACOSX" in parts or base.startswith("._") or base in (".DS_Store", "Thumbs.db")
+
+
+def process_one_zip(zip_path: Path, final_base_dir: Path):
     """
     Process single zip file. Raises on error.
-    Returns (model_name, model_dir_path, db_model_data)
+    Files are streamed straight from the archive into a staging folder next to the final one
+    (no temp extraction), which is renamed to the final name once complete.
+    Returns (model_dir_path, db_model_data)
     """
     logging.info(f"Processing {zip_path}")
-    # 1) extract to temp dir
-    with tempfile.TemporaryDirectory(dir=tmp_base) as tmpdir:
-        tmpdir_path = Path(tmpdir)
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zf:
-                zf.extractall(path=tmpdir)
-        except zipfile.BadZipFile:
-            raise RuntimeError(f"Bad zip file: {zip_path}")
-
-        # collect all files extracted (flatten from subfolders)
-        extracted_files = [p for p in tmpdir_path.rglob('*') if p.is_file()]
-        if not extracted_files:
+    try:
+        zf = zipfile.ZipFile(zip_path, 'r')
+    except zipfile.BadZipFile:
+        raise RuntimeError(f"Bad zip file: {zip_path}")
+
+    with zf:
+        # collect all file entries (flatten from subfolders)
+        members = [info for info in zf.infolist() if not info.is_dir() and not is_junk_entry(info.filename)]
+        member_files = [PurePosixPath(info.filename) for info in members]
+        if not members:
             raise RuntimeError(f"No files found in zip {zip_path}")
 
         # find metadata .txt file (first .txt)
-        txt_files = [p for p in extracted_files if p.suffix.lower() == ".txt"]
-        if not txt_files:
+        txt_indexes = [i for i, p in enumerate(member_files) if p.suffix.lower() == ".txt"]
+        if not txt_indexes:
             raise RuntimeError(f"No metadata .txt found in {zip_path}")
         # prefer file with same base name as zip if present
-        metadata_file = None
+        metadata_index = None
         base_name = zip_path.stem.lower()
-        for p in txt_files:
-            if p.stem.lower() == base_name:
-                metadata_file = p
+        for i in txt_indexes:
+            if member_files[i].stem.lower() == base_name:
+                metadata_index = i
                 break
-        if metadata_file is None:
-            metadata_file = txt_files[0]
+        if metadata_index is None:
+            metadata_index = txt_indexes[0]
 
-        # read metadata trying encodings
-        text= try_open(metadata_file)
+        # read metadata directly from the archive
+        text = zf.read(members[metadata_index]).decode("utf-8", errors="replace")
         logging.debug("Read metadata")
 
         parsed = parse_metadata_from_text(text)
@@ -192,18 +237,16 @@ def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
         uploaded_by = parsed.get("UploadedBy")
         description = parsed.get("Description")
 
-        # find geometry file on extracted_files. GeometryFile may be present or not.
+        # find geometry file among zip entries. GeometryFile may be present or not.
         geometry_path = None
         if geom_file_name:
-            for p in extracted_files:
+            for p in member_files:
                 if p.name == geom_file_name:
                     geometry_path = p
                     break
         if not geometry_path:
             # fallback: find first geometry by extension
-            g = find_geometry_file([str(p) for p in extracted_files])
-            if g:
-                geometry_path = Path(g)
+            geometry_path = find_geometry_file(member_files)
 
         if not geometry_path:
             raise RuntimeError(f"No geometry file found for {zip_path} (expected {geom_file_name})")
@@ -211,15 +254,14 @@ def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
         # find preview file:
         preview_path = None
         if preview_hint:
-            for p in extracted_files:
+            for p in member_files:
                 if p.name == preview_hint:
                     preview_path = p
                     break
         if preview_path is None:
             # fallback: any jpg/png
-            p = find_preview_file([str(p) for p in extracted_files])
-            if p:
-                preview_path = Path(p)
+            # (returns the same path object from member_files, matched by identity below)
+            preview_path = find_preview_file(member_files)
 
         if not preview_path:
             raise RuntimeError(f"No preview image found (jpg/png) in {zip_path}")
@@ -234,33 +276,35 @@ def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
             model_base = description or zip_path.stem
 
         model_name_safe = slugify(model_base)
-        # ensure unique directory in final_base_dir
-        target_dir = ensure_unique_dir(final_base_dir, model_name_safe)
-        logging.info(f"Planned final directory: {target_dir}")
-
-        # create target directory
-        target_dir.mkdir(parents=True, exist_ok=False)  # will error if race condition
+        # create unique staging directory in final_base_dir
+        staging_dir = ensure_unique_dir(final_base_dir, f".{model_name_safe}{PARTIAL_SUFFIX}")
 
-        # move/copy required files into target_dir, and also move all extracted files
+        # stream all zip entries into staging_dir
         try:
-            # normalize filenames and move
+            # normalize filenames and write
             moved_preview_name = None
-            for src in extracted_files:
+            # staging_dir is freshly created, so only our own files can collide;
+            # names are compared lowercased since case-insensitive filesystems treat Prev.png == prev.png
+            used_names = set()
+            for info, src in zip(members, member_files):
                 # decide destination filename (preserve extension)
-                dest_name = slugify(src.stem) + src.suffix.lower()
-                dest_path = target_dir / dest_name
+                suffix = src.suffix.lower()
+                dest_stem = slugify(src.stem)
+                dest_name = dest_stem + suffix
 
-                # if dest already exists, append _1 style
+                # if dest already taken, append _1 style
                 k = 1
-                while dest_path.exists():
-                    dest_path = target_dir / f"{dest_name.rsplit('.',1)[0]}_{k}{src.suffix.lower()}"
+                while dest_name.lower() in used_names:
+                    dest_name = f"{dest_stem}_{k}{suffix}"
                     k += 1
+                used_names.add(dest_name.lower())
 
-                shutil.move(str(src), str(dest_path))
+                with zf.open(info) as fsrc, open(staging_dir / dest_name, "wb") as fdst:
+                    shutil.copyfileobj(fsrc, fdst, length=COPY_BUFFER_SIZE)
 
                 # track preview file name as stored (relative filename)
-                if src.resolve() == preview_path.resolve() or src.name == preview_path.name:
-                    moved_preview_name = dest_path.name
+                if src is preview_path:
+                    moved_preview_name = dest_name
 
             # final sanity check
             if not moved_preview_name:
@@ -268,7 +312,7 @@ def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
 
             # parse and prepare model_data for DB insertion
             model_data = {
-                "model_name": target_dir.name,
+                "model_name": None,  # set once the folder is published
                 "format": (download_format or Path(geometry_path).suffix.lstrip(".")).upper(),
                 "source_url": download_url,
                 "download_date": parse_date(date_of_download) if date_of_download else None,
@@ -281,78 +325,176 @@ def process_one_zip(zip_path: Path, final_base_dir: Path, tmp_base: Path):
                 "preview_file": moved_preview_name
             }
 
+            # everything written: move into place under a unique final name
+            target_dir = publish_dir(staging_dir, final_base_dir, model_name_safe)
+            model_data["model_name"] = target_dir.name
+            logging.info(f"Created final directory: {target_dir}")
+
             return target_dir, model_data
 
         except Exception as e:
-            # On failure while moving files: try to remove created dir if it's present
+            # On failure while writing files: try to remove staging dir if it's present
             try:
-                if target_dir.exists():
-                    shutil.rmtree(target_dir)
+                if staging_dir.exists():
+                    shutil.rmtree(staging_dir)
             except Exception:
                 pass
             raise e
 
 
-def process_all_zips(input_dir: Path, final_base_dir: Path, tmp_base: Path):
+def iter_zip_files(root):
     """
-    Iterate .zip files in input_dir (non-recursive) and process them.
+    Yield paths of .zip files under root, recursively via os.scandir.
+    DirEntry caches the file type from readdir, so no extra stat per entry.
+    The importer's own _processed/_failed folders are skipped so zips are not picked up again.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in ("_processed", "_failed"):
+                    yield from iter_zip_files(entry.path)
+            # symlinked zips are imported like os.walk did; only directory symlinks are not followed
+            elif entry.is_file() and entry.name.lower().endswith(".zip"):
+                yield entry.path
+
+
+def process_all_zips(input_dir: Path, final_base_dir: Path):
+    """
+    Iterate .zip files in input_dir (including subdirectories) and process them.
     """
     init_database()  # ensure DB schema present
 
     input_dir = Path(input_dir)
     final_base_dir = Path(final_base_dir)
     final_base_dir.mkdir(parents=True, exist_ok=True)
-    tmp_base = Path(tmp_base)
-    tmp_base.mkdir(parents=True, exist_ok=True)
+    remove_partial_dirs(final_base_dir)
 
-    zip_paths = []
-    for root, dirs, files in os.walk(input_dir):
-        for f in files:
-            if f.lower().endswith(".zip"):
-                zip_paths.append(Path(root) / f)
+    zip_paths = [Path(p) for p in iter_zip_files(input_dir)]
 
     logging.info(f"Found {len(zip_paths)} zip files to process in {input_dir}")
 
-    for zp in zip_paths:
-        try:
-            target_dir, model_data = process_one_zip(zp, final_base_dir, tmp_base)
-            # Insert DB record inside try/except so we can rollback and remove folder if DB insert fails.
-            try:
-                model_id = insert_model(model_data)
-                logging.info(f"Inserted model id {model_id} for {model_data['model_name']}")
-            except Exception as db_exc:
-                # Remove created folder if DB insertion failed
-                logging.error(f"Database insert failed for {model_data.get('model_name')}: {db_exc}")
+    pending = []  # (zip_path, target_dir, model_data) waiting for DB insert
+    flushes = []  # submitted batch inserts
+    # Workers only unpack and move files; all DB work stays in this process.
+    # "spawn" keeps workers from inheriting the parent's open DB connections.
+    # A single writer thread commits batches in order while results keep being collected.
+    ctx = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=1) as db_writer:
+        with ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=ctx) as ex:
+            futures = {ex.submit(process_one_zip, zp, final_base_dir): zp for zp in zip_paths}
+            for fut in as_completed(futures):
+                zp = futures[fut]
                 try:
-                    if target_dir.exists():
-                        shutil.rmtree(target_dir)
-                        logging.info(f"Removed partial folder {target_dir} due to DB error.")
-                except Exception as rr:
-                    logging.error(f"Failed to remove partial folder {target_dir}: {rr}")
-                continue
-
-            # Optionally move processed zip to processed folder to avoid reprocessing
-            processed_dir = input_dir / "_processed"
-            processed_dir.mkdir(exist_ok=True)
-            dst = processed_dir / zp.name
-            shutil.move(str(zp), str(dst))
-            logging.info(f"Moved processed zip {zp.name} -> {dst}")
-        except Exception as exc:
-            logging.error(f"Failed to process {zp.name}: {exc}")
-            # move bad zip to failed folder for inspection
-            failed_dir = input_dir / "_failed"
-            failed_dir.mkdir(exist_ok=True)
+                    target_dir, model_data = fut.result()
+                except BrokenProcessPool as exc:
+                    # a worker died (e.g. OOM-killed); the zip itself may be fine, so leave it in place
+                    logging.error(f"Worker pool broke while processing {zp.name}, leaving it for next run: {exc}")
+                    continue
+                except Exception as exc:
+                    logging.error(f"Failed to process {zp.name}: {exc}")
+                    move_failed_zip(input_dir, zp)
+                    continue
+
+                pending.append((zp, target_dir, model_data))
+                if len(pending) >= INSERT_BATCH_SIZE:
+                    flushes.append(db_writer.submit(flush_inserts, input_dir, pending))
+                    pending = []
+
+        flushes.append(db_writer.submit(flush_inserts, input_dir, pending))
+
+    for f in flushes:
+        if f.exception() is not None:
+            logging.error(f"Batch insert failed unexpectedly: {f.exception()}")
+
+    # refresh statistics so the planner keeps using the listing index
+    try:
+        analyze_models()
+    except Exception as exc:
+        logging.error(f"Failed to analyze Model table: {exc}")
+
+
+def flush_inserts(input_dir: Path, pending):
+    """
+    Insert a batch of processed models in one transaction.
+    If the batch fails, retry row by row so a single bad row doesn't drop the whole batch.
+    """
+    if not pending:
+        return
+    try:
+        model_ids = insert_models_bulk([model_data for _, _, model_data in pending])
+    except Exception as db_exc:
+        logging.warning(f"Batch insert of {len(pending)} models failed ({db_exc}), retrying one by one")
+        # if the connection dropped, the batch may have committed before the error reached us
+        batch_maybe_committed = is_disconnect(db_exc)
+        for zp, target_dir, model_data in pending:
+            insert_one(input_dir, zp, target_dir, model_data, maybe_committed=batch_maybe_committed)
+        return
+
+    for (zp, _, model_data), model_id in zip(pending, model_ids):
+        logging.info(f"Inserted model id {model_id} for {model_data['model_name']}")
+        move_processed_zip(input_dir, zp)
+
+
+def insert_one(input_dir: Path, zp: Path, target_dir: Path, model_data: dict, maybe_committed=False):
+    """
+    Insert single model; on DB failure remove its folder and leave the zip in place.
+    maybe_committed: an earlier attempt (the batch) lost its connection and may have committed this row.
+    """
+    try:
+        model_id = insert_model(model_data)
+        logging.info(f"Inserted model id {model_id} for {model_data['model_name']}")
+    except Exception as db_exc:
+        # Only after a lost connection can a matching row be our own commit; any other
+        # failure (e.g. unique violation with an unrelated older row) must not adopt it.
+        model_id = None
+        if maybe_committed or is_disconnect(db_exc):
             try:
-                dst = failed_dir / zp.name
-                shutil.move(str(zp), str(dst))
-                logging.info(f"Moved failed zip {zp.name} -> {dst}")
-            except Exception as mv_exc:
-                logging.error(f"Failed to move failed zip {zp.name}: {mv_exc}")
+                model_id = find_model_id(model_data["model_name"], model_data["preview_file"])
+            except Exception:
+                model_id = None
+        if model_id is not None:
+            logging.warning(f"Insert for {model_data['model_name']} reported {db_exc!r} but row {model_id} exists; keeping it")
+            move_processed_zip(input_dir, zp)
+            return
+
+        # Remove created folder if DB insertion failed
+        logging.error(f"Database insert failed for {model_data.get('model_name')}: {db_exc}")
+        try:
+            if target_dir.exists():
+                shutil.rmtree(target_dir)
+                logging.info(f"Removed partial folder {target_dir} due to DB error.")
+        except Exception as rr:
+            logging.error(f"Failed to remove partial folder {target_dir}: {rr}")
+        return
+    move_processed_zip(input_dir, zp)
+
+
+def move_processed_zip(input_dir: Path, zp: Path):
+    """Move processed zip to processed folder to avoid reprocessing."""
+    try:
+        processed_dir = input_dir / "_processed"
+        processed_dir.mkdir(exist_ok=True)
+        dst = processed_dir / zp.name
+        shutil.move(str(zp), str(dst))
+        logging.info(f"Moved processed zip {zp.name} -> {dst}")
+    except Exception as mv_exc:
+        logging.error(f"Failed to move processed zip {zp.name}: {mv_exc}")
+
+
+def move_failed_zip(input_dir: Path, zp: Path):
+    """Move bad zip to failed folder for inspection."""
+    failed_dir = input_dir / "_failed"
+    failed_dir.mkdir(exist_ok=True)
+    try:
+        dst = failed_dir / zp.name
+        shutil.move(str(zp), str(dst))
+        logging.info(f"Moved failed zip {zp.name} -> {dst}")
+    except Exception as mv_exc:
+        logging.error(f"Failed to move failed zip {zp.name}: {mv_exc}")
 
 
 if __name__ == "__main__":
     input_dir = Path("../data/download")
     output_dir = Path("../data/models")
-    tmp_dir = Path("model_import_tmp") 
 
-    process_all_zips(input_dir, output_dir, tmp_dir)
+    process_all_zips(input_dir, output_dir)